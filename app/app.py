@@ -1,12 +1,54 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request
+from flask_compress import Compress
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import pool as pg_pool
 import redis
-import json
+import orjson
+import zstandard
+import hashlib
+import logging
 import os
+import queue
+import threading
+import time
+from serializers import user_row_to_json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
 app = Flask(__name__)
+Compress(app)  # gzip/brotli à la volée vers les clients qui l'acceptent
+
+# Borne la taille des corps de requête: échec rapide sur les envois démesurés
+app.config['MAX_CONTENT_LENGTH'] = 1 << 16
+
+# Journalisation asynchrone: les threads de requête ne font qu'empiler un
+# enregistrement (O(1), pas d'I/O); un thread dédié écrit sur stderr. La
+# file est bornée: en cas de surcharge pathologique on perd des logs
+# plutôt que de bloquer le traitement des requêtes.
+_LOG_QUEUE = queue.Queue(maxsize=10000)
+
+class _BoundedQueueHandler(QueueHandler):
+    """QueueHandler qui abandonne l'enregistrement quand la file est pleine"""
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+_log_listener = None
+
+def start_log_listener():
+    """(Re)démarre le thread d'écoute des logs; à rappeler après un fork"""
+    global _log_listener
+    _log_listener = QueueListener(_LOG_QUEUE, logging.StreamHandler())
+    _log_listener.start()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(_BoundedQueueHandler(_LOG_QUEUE))
+start_log_listener()
 
 # Configuration depuis les variables d'environnement
 DB_CONFIG = {
@@ -23,266 +65,593 @@ REDIS_CONFIG = {
     'db': 0
 }
 
-def get_db_connection():
-    """Établit une connexion à PostgreSQL"""
+# Client Redis partagé: thread-safe, adossé à un pool de connexions
+REDIS_POOL = redis.ConnectionPool(max_connections=50, **REDIS_CONFIG)
+REDIS = redis.Redis(connection_pool=REDIS_POOL)
+
+# Pool de connexions PostgreSQL partagé (créé à la première utilisation)
+POOL = None
+_POOL_LOCK = threading.Lock()
+
+# Stale-while-revalidate: TTL "dur" des entrées de cache; au-delà de la
+# fenêtre de fraîcheur, l'entrée périmée est servie pendant qu'un worker
+# la rafraîchit en arrière-plan
+CACHE_TTL = 300
+FRESH_USERS_ALL = 30
+FRESH_USER = 60
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=4)
+
+# Compression zstd des valeurs mises en cache: réduit la mémoire Redis et
+# la bande passante. Les petites valeurs restent en clair (le surcoût ne
+# vaut pas le gain). users:all est exemptée quelle que soit sa taille: le
+# patch Lua doit pouvoir décoder la liste, sinon chaque écriture retombe
+# sur l'invalidation brutale que le patch est censé remplacer.
+_ZSTD_MIN_SIZE = 1024
+_ZSTD_EXEMPT_KEYS = frozenset({'users:all'})
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_zstd_compress = zstandard.ZstdCompressor(level=3).compress
+_zstd_decompress = zstandard.ZstdDecompressor().decompress
+
+def ojsonify(obj, status=200):
+    """Sérialise une réponse JSON via orjson (plus rapide que le json standard)"""
+    return raw_json_response(orjson.dumps(obj), status)
+
+def raw_json_response(payload, status=200, max_age=None):
+    """Renvoie des octets JSON déjà sérialisés sans les re-parser"""
+    response = app.response_class(payload, status=status, mimetype='application/json')
+    if max_age is not None:
+        # Autorise les clients/CDN à réutiliser la réponse pendant max_age s
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+def parse_json_body():
+    """Désérialise le corps de la requête via orjson (plus rapide que get_json).
+
+    Renvoie None si le corps n'est pas un objet JSON valide; `cache=False`
+    évite de garder une seconde copie du corps brut en mémoire.
+    """
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        print(f"Erreur de connexion à la base: {e}")
+        data = orjson.loads(request.get_data(cache=False) or b'{}')
+    except orjson.JSONDecodeError:
         return None
+    return data if isinstance(data, dict) else None
+
+def conditional_json_response(payload, max_age):
+    """Réponse JSON avec ETag fort; 304 sans corps si If-None-Match correspond.
 
-def get_redis_connection():
-    """Établit une connexion à Redis"""
+    BLAKE2b (128 bits) est plus rapide que SHA-256 et largement suffisant
+    pour distinguer des versions de réponse.
+    """
+    etag = hashlib.blake2b(payload, digest_size=16).hexdigest()
+    # Flask-Compress suffixe l'ETag de l'encodage négocié (hash:gzip, ...)
+    # après coup: accepter aussi ces formes, sinon les clients qui acceptent
+    # la compression rejouent un ETag jamais reconnu et ne voient aucun 304
+    client_etags = (etag, f'{etag}:gzip', f'{etag}:br', f'{etag}:deflate')
+    if any(request.if_none_match.contains(tag) for tag in client_etags):
+        response = app.response_class(status=304)
+    else:
+        response = raw_json_response(payload, 200, max_age=max_age)
+    response.set_etag(etag)
+    return response
+
+class _PoolConnection(psycopg2.extensions.connection):
+    """Connexion du pool portant l'état de préparation des requêtes chaudes"""
+    statements_prepared = False
+
+# Requêtes chaudes préparées une seule fois par connexion du pool: le
+# serveur ne re-parse/re-planifie plus le SQL à chaque requête HTTP
+_PREPARED_STATEMENTS = (
+    "PREPARE get_user_stmt (int) AS "
+    "SELECT row_to_json(u)::text FROM "
+    "(SELECT id, name, email, created_at FROM users WHERE id = $1) u",
+    "PREPARE get_users_stmt AS "
+    "SELECT COALESCE(json_agg(u ORDER BY u.id), '[]'::json)::text "
+    "FROM (SELECT id, name, email, created_at FROM users) u",
+    "PREPARE create_user_stmt (varchar, varchar) AS "
+    "INSERT INTO users (name, email) VALUES ($1, $2) "
+    "RETURNING id, name, email, created_at",
+    "PREPARE delete_user_stmt (int) AS "
+    "DELETE FROM users WHERE id = $1 RETURNING id",
+    "PREPARE update_user_stmt (varchar, varchar, int) AS "
+    "UPDATE users SET name = COALESCE($1, name), email = COALESCE($2, email) "
+    "WHERE id = $3 RETURNING id, name, email, created_at",
+)
+
+def _prepare_statements(conn):
+    """Prépare les requêtes chaudes sur une connexion fraîchement empruntée"""
+    cur = conn.cursor()
     try:
-        r = redis.Redis(**REDIS_CONFIG)
-        r.ping()  # Test de connexion
-        return r
-    except Exception as e:
-        print(f"Erreur de connexion à Redis: {e}")
+        for stmt in _PREPARED_STATEMENTS:
+            cur.execute(stmt)
+        conn.commit()
+    finally:
+        cur.close()
+
+def _get_pool():
+    """Crée (une seule fois) puis renvoie le pool de connexions PostgreSQL"""
+    global POOL
+    if POOL is None:
+        with _POOL_LOCK:
+            if POOL is None:
+                try:
+                    POOL = pg_pool.ThreadedConnectionPool(
+                        minconn=2, maxconn=20,
+                        connection_factory=_PoolConnection, **DB_CONFIG
+                    )
+                except Exception as e:
+                    logger.exception("Erreur de connexion à la base: %s", e)
+    return POOL
+
+@contextmanager
+def db_conn(prepare=True):
+    """Emprunte une connexion au pool et la restitue en fin d'utilisation.
+
+    `prepare=False` sert aux chemins qui tournent avant la création de la
+    table (init_db) ou qui n'utilisent pas les requêtes préparées.
+    """
+    pool = _get_pool()
+    if pool is None:
+        raise psycopg2.OperationalError("pool PostgreSQL indisponible")
+    conn = pool.getconn()
+    try:
+        if prepare and not conn.statements_prepared:
+            _prepare_statements(conn)
+            conn.statements_prepared = True
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+def cache_get(key, loader, fresh_for):
+    """Lit une clé du cache en mode stale-while-revalidate.
+
+    Renvoie l'entrée même périmée; si la fenêtre de fraîcheur est dépassée,
+    un rafraîchissement est déclenché en arrière-plan via `loader`.
+    Une panne Redis est traitée comme un cache miss.
+    """
+    try:
+        pipe = REDIS.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.get(f'{key}:fresh_until')
+        cached, fresh_until = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("Erreur de connexion à Redis: %s", e)
+        return None
+
+    if cached is None:
         return None
 
+    if fresh_until is None or time.time() >= float(fresh_until):
+        _spawn_refresh(key, loader, fresh_for)
+    if cached.startswith(_ZSTD_MAGIC):
+        cached = _zstd_decompress(cached)
+    return cached
+
+def cache_set(key, payload, fresh_for):
+    """Écrit une entrée et sa fenêtre de fraîcheur; une panne Redis est ignorée"""
+    if key not in _ZSTD_EXEMPT_KEYS and len(payload) >= _ZSTD_MIN_SIZE:
+        payload = _zstd_compress(payload)
+    try:
+        pipe = REDIS.pipeline(transaction=False)
+        pipe.setex(key, CACHE_TTL, payload)
+        pipe.setex(f'{key}:fresh_until', CACHE_TTL, time.time() + fresh_for)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("Erreur de connexion à Redis: %s", e)
+
+def cache_delete(*keys):
+    """Invalide des clés du cache en un seul aller-retour; une panne Redis est ignorée"""
+    try:
+        pipe = REDIS.pipeline(transaction=False)
+        for key in keys:
+            pipe.delete(key)
+            pipe.delete(f'{key}:fresh_until')
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning("Erreur de connexion à Redis: %s", e)
+
+# Patch atomique de la liste users:all côté Redis: on modifie seulement
+# l'entrée touchée par l'écriture au lieu de jeter toute la liste.
+# Retombe sur une suppression si le cache est absent ou illisible.
+_USERS_ALL_PATCH_LUA = """
+local cached = redis.call('GET', KEYS[1])
+if not cached then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+local ok, list = pcall(cjson.decode, cached)
+if not ok or type(list) ~= 'table' then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+local op = ARGV[1]
+local id = tonumber(ARGV[2])
+local result = {}
+if op == 'insert' then
+    -- ids SERIAL croissants et liste triée par id: on ajoute en fin
+    list[#list + 1] = cjson.decode(ARGV[3])
+    result = list
+elseif op == 'update' then
+    for i, u in ipairs(list) do
+        if u.id == id then list[i] = cjson.decode(ARGV[3]) end
+    end
+    result = list
+else
+    for _, u in ipairs(list) do
+        if u.id ~= id then result[#result + 1] = u end
+    end
+end
+local body = '[]'
+if #result > 0 then body = cjson.encode(result) end
+redis.call('SET', KEYS[1], body, 'EX', tonumber(ARGV[4]))
+redis.call('SET', KEYS[2], ARGV[5], 'EX', tonumber(ARGV[4]))
+return 1
+"""
+_users_all_patch = REDIS.register_script(_USERS_ALL_PATCH_LUA)
+
+def cache_patch_users_all(op, user_id, user_payload=b''):
+    """Répercute une écriture (`insert`/`update`/`delete`) sur users:all en place"""
+    try:
+        _users_all_patch(
+            keys=['users:all', 'users:all:fresh_until'],
+            args=[op, user_id, user_payload, CACHE_TTL, time.time() + FRESH_USERS_ALL]
+        )
+    except redis.RedisError as e:
+        logger.warning("Erreur de connexion à Redis: %s", e)
+
+def _spawn_refresh(key, loader, fresh_for):
+    """Planifie un rafraîchissement de `key`; le verrou Redis évite les ruées"""
+    try:
+        if not REDIS.set(f'cache:lock:{key}', 1, nx=True, ex=10):
+            return  # un autre worker rafraîchit déjà cette clé
+    except redis.RedisError:
+        return
+    _REFRESH_POOL.submit(_refresh_entry, key, loader, fresh_for)
+
+def _refresh_entry(key, loader, fresh_for):
+    """Recharge une entrée depuis PostgreSQL puis relâche le verrou"""
+    try:
+        payload = loader()
+        if payload is not None:
+            cache_set(key, payload, fresh_for)
+    except Exception as e:
+        logger.exception("Erreur lors du rafraîchissement du cache %s: %s", key, e)
+    finally:
+        try:
+            REDIS.delete(f'cache:lock:{key}')
+        except redis.RedisError:
+            pass
+
+# Identifiant du verrou consultatif protégeant l'initialisation du schéma
+_INIT_DB_LOCK_ID = 815001
+
 def init_db():
     """Initialise la base de données avec la table users"""
-    conn = get_db_connection()
-    if conn:
-        try:
+    try:
+        with db_conn(prepare=False) as conn:
+            cur = conn.cursor()
+            # Verrou consultatif: un seul processus exécute le CREATE TABLE
+            cur.execute('SELECT pg_advisory_lock(%s)', (_INIT_DB_LOCK_ID,))
+            try:
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS users (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(100) NOT NULL,
+                        email VARCHAR(100) UNIQUE NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                # Index couvrant: la recherche par id lit toutes les colonnes
+                # depuis l'index sans visiter le tas (index-only scan)
+                cur.execute('''
+                    CREATE INDEX IF NOT EXISTS users_pk_covering
+                    ON users (id) INCLUDE (name, email, created_at)
+                ''')
+                conn.commit()
+            finally:
+                # Purger une éventuelle transaction avortée: l'unlock doit
+                # s'exécuter (le rollback ne relâche pas un verrou de session)
+                # et la connexion retourner au pool sans verrou ni transaction
+                conn.rollback()
+                cur.execute('SELECT pg_advisory_unlock(%s)', (_INIT_DB_LOCK_ID,))
+                cur.close()
+        logger.info("Base de données initialisée avec succès")
+    except Exception as e:
+        logger.exception("Erreur lors de l'initialisation: %s", e)
+
+def reset_pools():
+    """Ferme les connexions héritées du master après un fork (gunicorn --preload)"""
+    global POOL
+    with _POOL_LOCK:
+        if POOL is not None:
+            try:
+                POOL.closeall()
+            except Exception:
+                pass
+            POOL = None
+    try:
+        REDIS_POOL.disconnect()
+    except redis.RedisError:
+        pass
+
+# Horodatage d'affichage de /health, recalculé au plus une fois par seconde:
+# sous le matraquage des sondes externes, inutile de reformater à chaque hit
+_last_ts = ('', 0.0)
+
+def _now_iso():
+    """Horodatage ISO purement indicatif, mis en cache à la seconde près"""
+    global _last_ts
+    now = time.time()
+    if now - _last_ts[1] >= 1.0:
+        _last_ts = (datetime.now().isoformat(), now)
+    return _last_ts[0]
+
+# État de santé des services, entretenu par une sonde d'arrière-plan:
+# /health ne fait plus aucune I/O par requête
+_HEALTH_PROBE_INTERVAL = 5
+_HEALTH_LOCK = threading.Lock()
+_health = {'database': 'unknown', 'redis': 'unknown', 'checked_at': None}
+
+def _probe_services():
+    """Sonde PostgreSQL et Redis puis met à jour l'état partagé"""
+    try:
+        with db_conn(prepare=False) as conn:
             cur = conn.cursor()
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            conn.commit()
+            cur.execute('SELECT 1')
             cur.close()
-            conn.close()
-            print("Base de données initialisée avec succès")
-        except Exception as e:
-            print(f"Erreur lors de l'initialisation: {e}")
+        db_status = "healthy"
+    except Exception:
+        db_status = "unhealthy"
+
+    try:
+        REDIS.ping()
+        redis_status = "healthy"
+    except redis.RedisError:
+        redis_status = "unhealthy"
+
+    with _HEALTH_LOCK:
+        _health['database'] = db_status
+        _health['redis'] = redis_status
+        _health['checked_at'] = datetime.now().isoformat()
+
+def _health_probe_loop():
+    """Boucle de la sonde: une mesure toutes les _HEALTH_PROBE_INTERVAL secondes"""
+    while True:
+        _probe_services()
+        time.sleep(_HEALTH_PROBE_INTERVAL)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check pour vérifier la connectivité de tous les services"""
-    db_status = "healthy" if get_db_connection() else "unhealthy"
-    redis_status = "healthy" if get_redis_connection() else "unhealthy"
-    
-    return jsonify({
+    """Health check basé sur la dernière sonde: lecture mémoire, zéro I/O"""
+    with _HEALTH_LOCK:
+        db_status = _health['database']
+        redis_status = _health['redis']
+        checked_at = _health['checked_at']
+
+    return ojsonify({
         'status': 'success',
         'services': {
             'database': db_status,
             'redis': redis_status
         },
-        'timestamp': datetime.now().isoformat()
-    }), 200 if all([db_status == "healthy", redis_status == "healthy"]) else 503
+        'timestamp': _now_iso(),
+        'checked_at': checked_at
+    }, 200 if all([db_status == "healthy", redis_status == "healthy"]) else 503)
 
 @app.route('/users', methods=['POST'])
 def create_user():
     """Crée un nouvel utilisateur"""
-    data = request.get_json()
-    
+    data = parse_json_body()
+
     if not data or not data.get('name') or not data.get('email'):
-        return jsonify({'error': 'Name and email are required'}), 400
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
+        return ojsonify({'error': 'Name and email are required'}, 400)
+
     try:
-        cur = conn.cursor()
-        cur.execute(
-            'INSERT INTO users (name, email) VALUES (%s, %s) RETURNING id, name, email, created_at',
-            (data['name'], data['email'])
-        )
-        user = cur.fetchone()
-        conn.commit()
-        
-        # Invalider le cache Redis pour la liste des utilisateurs
-        redis_conn = get_redis_connection()
-        if redis_conn:
-            redis_conn.delete('users:all')
-        
-        return jsonify({
-            'id': user[0],
-            'name': user[1],
-            'email': user[2],
-            'created_at': user[3].isoformat()
-        }), 201
-        
+        with db_conn() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute('EXECUTE create_user_stmt(%s, %s)', (data['name'], data['email']))
+                user = cur.fetchone()
+                conn.commit()
+            finally:
+                cur.close()
+
+        # orjson sérialise les datetime nativement, pas besoin d'isoformat()
+        payload = user_row_to_json(user)
+
+        # Write-through: semer le cache avec la ligne fraîche pour que la
+        # prochaine lecture soit un hit, et répercuter l'insertion sur la
+        # liste en cache plutôt que de la jeter
+        cache_set(f'user:{user[0]}', payload, FRESH_USER)
+        cache_patch_users_all('insert', user[0], payload)
+
+        return raw_json_response(payload, 201)
+
+    except pg_pool.PoolError:
+        return ojsonify({'error': 'Database pool exhausted'}, 503)
     except psycopg2.IntegrityError:
-        return jsonify({'error': 'Email already exists'}), 400
+        return ojsonify({'error': 'Email already exists'}, 400)
+    except psycopg2.OperationalError:
+        return ojsonify({'error': 'Database connection failed'}, 500)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+        return ojsonify({'error': str(e)}, 500)
+
+def load_users_payload():
+    """Recharge la liste des utilisateurs depuis PostgreSQL en octets JSON.
+
+    PostgreSQL agrège lui-même les lignes en JSON (json_agg): pas de boucle
+    Python par ligne, la réponse passe directement des octets de la base au
+    cache Redis et au client.
+    """
+    with db_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute('EXECUTE get_users_stmt')
+            payload = cur.fetchone()[0]
+        finally:
+            cur.close()
+
+    return payload.encode()
+
+def load_user_payload(user_id):
+    """Recharge un utilisateur depuis PostgreSQL; None si introuvable.
+
+    Comme pour la liste, PostgreSQL rend la ligne en JSON (row_to_json):
+    aucun parse de timestamp ni construction de datetime côté Python.
+    """
+    with db_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute('EXECUTE get_user_stmt(%s)', (user_id,))
+            row = cur.fetchone()
+        finally:
+            cur.close()
+
+    if not row:
+        return None
+    return row[0].encode()
 
 @app.route('/users', methods=['GET'])
 def get_users():
     """Récupère tous les utilisateurs avec cache Redis"""
-    # Vérifier d'abord le cache Redis
-    redis_conn = get_redis_connection()
-    if redis_conn:
-        cached_users = redis_conn.get('users:all')
-        if cached_users:
-            return jsonify(json.loads(cached_users)), 200
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
+    # Vérifier d'abord le cache Redis (servi même périmé, rafraîchi en fond)
+    cached_users = cache_get('users:all', load_users_payload, FRESH_USERS_ALL)
+    if cached_users:
+        # Redis renvoie exactement les octets JSON à servir: pas de loads/dumps
+        return conditional_json_response(cached_users, FRESH_USERS_ALL)
+
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('SELECT id, name, email, created_at FROM users ORDER BY id')
-        users = cur.fetchall()
-        
-        # Convertir les résultats en format sérialisable
-        users_list = []
-        for user in users:
-            user_dict = dict(user)
-            user_dict['created_at'] = user_dict['created_at'].isoformat()
-            users_list.append(user_dict)
-        
-        # Mettre en cache dans Redis (expire après 30 secondes)
-        if redis_conn:
-            redis_conn.setex('users:all', 30, json.dumps(users_list))
-        
-        return jsonify(users_list), 200
-        
+        payload = load_users_payload()
+
+        # Mettre en cache dans Redis
+        cache_set('users:all', payload, FRESH_USERS_ALL)
+
+        return conditional_json_response(payload, FRESH_USERS_ALL)
+
+    except pg_pool.PoolError:
+        return ojsonify({'error': 'Database pool exhausted'}, 503)
+    except psycopg2.OperationalError:
+        return ojsonify({'error': 'Database connection failed'}, 500)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+        return ojsonify({'error': str(e)}, 500)
 
 @app.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Récupère un utilisateur spécifique"""
-    # Vérifier le cache Redis
-    redis_conn = get_redis_connection()
+    # Vérifier le cache Redis (servi même périmé, rafraîchi en fond)
     cache_key = f'user:{user_id}'
-    if redis_conn:
-        cached_user = redis_conn.get(cache_key)
-        if cached_user:
-            return jsonify(json.loads(cached_user)), 200
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
+    cached_user = cache_get(cache_key, lambda: load_user_payload(user_id), FRESH_USER)
+    if cached_user:
+        # Même principe que users:all: on sert les octets du cache tels quels
+        return conditional_json_response(cached_user, FRESH_USER)
+
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('SELECT id, name, email, created_at FROM users WHERE id = %s', (user_id,))
-        user = cur.fetchone()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        user_dict = dict(user)
-        user_dict['created_at'] = user_dict['created_at'].isoformat()
-        
-        # Mettre en cache dans Redis (expire après 60 secondes)
-        if redis_conn:
-            redis_conn.setex(cache_key, 60, json.dumps(user_dict))
-        
-        return jsonify(user_dict), 200
-        
+        payload = load_user_payload(user_id)
+
+        if payload is None:
+            return ojsonify({'error': 'User not found'}, 404)
+
+        # Mettre en cache dans Redis
+        cache_set(cache_key, payload, FRESH_USER)
+
+        return conditional_json_response(payload, FRESH_USER)
+
+    except pg_pool.PoolError:
+        return ojsonify({'error': 'Database pool exhausted'}, 503)
+    except psycopg2.OperationalError:
+        return ojsonify({'error': 'Database connection failed'}, 500)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+        return ojsonify({'error': str(e)}, 500)
 
 @app.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     """Met à jour un utilisateur"""
-    data = request.get_json()
-    
-    if not data or (not data.get('name') and not data.get('email')):
-        return jsonify({'error': 'Name or email is required'}), 400
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
+    data = parse_json_body()
+
+    # Valider en amont: champs absents, vides ou blancs -> NULL, et au
+    # moins un champ doit rester à mettre à jour
+    name = data.get('name') if data else None
+    email = data.get('email') if data else None
+    if (name is not None and not isinstance(name, str)) or \
+            (email is not None and not isinstance(email, str)):
+        return ojsonify({'error': 'Name and email must be strings'}, 400)
+    name = (name or '').strip() or None
+    email = (email or '').strip() or None
+    if name is None and email is None:
+        return ojsonify({'error': 'Name or email is required'}, 400)
+
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Construire la requête dynamiquement
-        update_fields = []
-        values = []
-        
-        if 'name' in data:
-            update_fields.append("name = %s")
-            values.append(data['name'])
-        if 'email' in data:
-            update_fields.append("email = %s")
-            values.append(data['email'])
-        
-        values.append(user_id)
-        query = f'UPDATE users SET {", ".join(update_fields)} WHERE id = %s RETURNING id, name, email, created_at'
-        
-        cur.execute(query, values)
-        user = cur.fetchone()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        conn.commit()
-        
-        # Invalider les caches Redis
-        redis_conn = get_redis_connection()
-        if redis_conn:
-            redis_conn.delete('users:all')
-            redis_conn.delete(f'user:{user_id}')
-        
-        user_dict = dict(user)
-        user_dict['created_at'] = user_dict['created_at'].isoformat()
-        
-        return jsonify(user_dict), 200
-        
+        with db_conn() as conn:
+            cur = conn.cursor()
+            try:
+                # Requête fixe: COALESCE conserve la valeur existante pour
+                # les champs non fournis, et le plan préparé est réutilisé
+                cur.execute('EXECUTE update_user_stmt(%s, %s, %s)', (name, email, user_id))
+                user = cur.fetchone()
+
+                if not user:
+                    return ojsonify({'error': 'User not found'}, 404)
+
+                conn.commit()
+            finally:
+                cur.close()
+
+        payload = user_row_to_json(user)
+
+        # Write-through: remplacer l'entrée individuelle par la ligne fraîche
+        # et patcher la liste en cache
+        cache_set(f'user:{user_id}', payload, FRESH_USER)
+        cache_patch_users_all('update', user_id, payload)
+
+        return raw_json_response(payload, 200)
+
+    except pg_pool.PoolError:
+        return ojsonify({'error': 'Database pool exhausted'}, 503)
     except psycopg2.IntegrityError:
-        return jsonify({'error': 'Email already exists'}), 400
+        return ojsonify({'error': 'Email already exists'}, 400)
+    except psycopg2.OperationalError:
+        return ojsonify({'error': 'Database connection failed'}, 500)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+        return ojsonify({'error': str(e)}, 500)
 
 @app.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     """Supprime un utilisateur"""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
     try:
-        cur = conn.cursor()
-        cur.execute('DELETE FROM users WHERE id = %s RETURNING id', (user_id,))
-        deleted_user = cur.fetchone()
-        
-        if not deleted_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        conn.commit()
-        
-        # Invalider les caches Redis
-        redis_conn = get_redis_connection()
-        if redis_conn:
-            redis_conn.delete('users:all')
-            redis_conn.delete(f'user:{user_id}')
-        
-        return jsonify({'message': 'User deleted successfully'}), 200
-        
+        with db_conn() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute('EXECUTE delete_user_stmt(%s)', (user_id,))
+                deleted_user = cur.fetchone()
+
+                if not deleted_user:
+                    return ojsonify({'error': 'User not found'}, 404)
+
+                conn.commit()
+            finally:
+                cur.close()
+
+        # Retirer l'entrée de la liste en cache et invalider l'entrée individuelle
+        cache_patch_users_all('delete', user_id)
+        cache_delete(f'user:{user_id}')
+
+        return ojsonify({'message': 'User deleted successfully'}, 200)
+
+    except pg_pool.PoolError:
+        return ojsonify({'error': 'Database pool exhausted'}, 503)
+    except psycopg2.OperationalError:
+        return ojsonify({'error': 'Database connection failed'}, 500)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+        return ojsonify({'error': str(e)}, 500)
+
+def start_health_probe():
+    """Démarre la sonde de santé (à relancer dans chaque worker après fork)"""
+    threading.Thread(target=_health_probe_loop, daemon=True).start()
+
+# Initialiser la base au chargement du module: avec gunicorn --preload, le
+# master l'exécute une fois avant de forker les workers
+init_db()
 
 if __name__ == '__main__':
-    # Initialiser la base au démarrage
-    init_db()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Serveur de développement uniquement; la production passe par gunicorn
+    start_health_probe()
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
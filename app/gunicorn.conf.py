@@ -0,0 +1,19 @@
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+workers = multiprocessing.cpu_count()
+worker_class = "gthread"
+threads = 16
+
+# Le master charge l'application (et exécute init_db) une seule fois avant
+# de forker: le code chaud est partagé en copy-on-write entre les workers
+preload_app = True
+
+def post_fork(server, worker):
+    """Réinitialise les ressources qui ne survivent pas au fork"""
+    import app
+    # Les connexions DB/Redis héritées du master ne doivent pas être
+    # partagées entre workers, et les threads du master ne sont pas forkés
+    app.reset_pools()
+    app.start_health_probe()
+    app.start_log_listener()
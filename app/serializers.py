@@ -0,0 +1,25 @@
+"""Assemblage des lignes users en octets JSON.
+
+Module séparé et entièrement annoté: compilable tel quel avec mypyc
+(`mypyc serializers.py`) pour supprimer le surcoût de l'interpréteur sur
+ce chemin chaud; sans compilation, l'import retombe sur le .py pur.
+"""
+from datetime import datetime
+from typing import Tuple
+
+import orjson
+
+
+def user_row_to_json(row: Tuple[int, str, str, datetime]) -> bytes:
+    """Sérialise une ligne (id, name, email, created_at) en octets JSON.
+
+    Le timestamp naïf est rendu sans décalage horaire, comme le fait
+    PostgreSQL via row_to_json/json_agg sur les chemins de lecture: un même
+    utilisateur garde le même format quel que soit l'état du cache.
+    """
+    return orjson.dumps({
+        'id': row[0],
+        'name': row[1],
+        'email': row[2],
+        'created_at': row[3],
+    })
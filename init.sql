@@ -5,7 +5,11 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-INSERT INTO users (name, email) VALUES 
+-- Index couvrant: la recherche par id se fait en index-only scan
+CREATE INDEX IF NOT EXISTS users_pk_covering
+    ON users (id) INCLUDE (name, email, created_at);
+
+INSERT INTO users (name, email) VALUES
     ('John Doe', 'john.doe@example.com'),
     ('Jane Smith', 'jane.smith@example.com')
 ON CONFLICT (email) DO NOTHING;
\ No newline at end of file